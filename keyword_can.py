@@ -2,11 +2,258 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
+from io import BytesIO
 
-def main():
-    # Set the page configuration
-    st.set_page_config(page_title="📊 Keyword Cannibalisation", layout="wide")
+try:
+    import polars as pl
+except ImportError:  # optional fast path for large uploads
+    pl = None
+
+REQUIRED_COLUMNS = ['Impressions', 'Query', 'Landing Page']
+
+# Column layouts of the two frames returned by process_data
+FINAL_COLUMNS = ['Landing Page', 'Query', 'Impressions', 'Total Keyword Impressions', 'Percentage of Impressions']
+TOP_COLUMNS = ['Query', 'Total Keyword Impressions', 'Landing Page']
+
+# Uploads above this size take the multithreaded Polars path when available
+LARGE_UPLOAD_BYTES = 50 * 1024 * 1024
+
+def _process_data_polars(csv_bytes: bytes, brand_terms: tuple[str, ...]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Polars fast path mirroring the pandas pipeline in one lazy plan.
+
+    Polars runs the filter/groupby/window steps multithreaded with
+    predicate pushdown; only the two small result frames are converted
+    back to pandas for the Streamlit display.
+    """
+    lazy = pl.scan_csv(BytesIO(csv_bytes))
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in lazy.collect_schema().names()]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+
+    lazy = lazy.select(REQUIRED_COLUMNS).with_columns(
+        pl.col('Impressions').cast(pl.Int32, strict=False)
+    ).drop_nulls('Impressions')
+    if brand_terms:
+        lazy = lazy.filter(~pl.col('Query').is_in(list(brand_terms)))
+    pairs = lazy.filter(pl.col('Impressions') >= 10).group_by('Query', 'Landing Page').agg(
+        pl.col('Impressions').sum()
+    )
+
+    # As in the pandas path, the ratio compares and the ceiling division run
+    # in Int64 so the *100 products cannot wrap for large-site totals
+    rows = pairs.with_columns(
+        pl.col('Impressions').sum().over('Query').cast(pl.Int64).alias('Total Keyword Impressions')
+    ).filter(
+        (pl.col('Impressions').cast(pl.Int64) * 10 > pl.col('Total Keyword Impressions'))
+        & (pl.col('Impressions').cast(pl.Int64) * 100 < 75 * pl.col('Total Keyword Impressions'))
+    ).with_columns(
+        ((pl.col('Impressions').cast(pl.Int64) * 100 + pl.col('Total Keyword Impressions') - 1)
+         // pl.col('Total Keyword Impressions'))
+        .cast(pl.Int32).alias('Percentage of Impressions')
+    ).sort(
+        ['Total Keyword Impressions', 'Query'], descending=[True, False]
+    ).select(FINAL_COLUMNS)
+
+    top = pairs.group_by('Query').agg(
+        pl.col('Impressions').sum().alias('Total Keyword Impressions'),
+        pl.len().alias('Landing Page'),
+    ).filter(pl.col('Landing Page') > 1).top_k(
+        10, by='Total Keyword Impressions'
+    ).sort(
+        # top_k does not guarantee order; sort to match the pandas
+        # path's nlargest so the chart renders identically
+        'Total Keyword Impressions', descending=True
+    ).select(TOP_COLUMNS)
+
+    df, top_cannibalized = pl.collect_all([rows, top])
+    return df.to_pandas(), top_cannibalized.to_pandas()
+
+def _process_data_chunked(csv_bytes: bytes, brand_terms: tuple[str, ...],
+                          chunksize: int = 500_000) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Stream a very large upload in chunks, aggregating as it goes.
+
+    Each chunk is filtered and summed into a running per-(Query, Landing
+    Page) Series, so peak memory is proportional to the number of
+    distinct pairs rather than the number of raw rows. ``chunksize`` is
+    overridable so tests can force the multi-chunk path on small inputs.
+    """
+    header = pd.read_csv(BytesIO(csv_bytes), nrows=0)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in header.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+
+    brand_set = frozenset(brand_terms)
+    pair_totals = None
+    reader = pd.read_csv(
+        BytesIO(csv_bytes), chunksize=chunksize, usecols=REQUIRED_COLUMNS, engine='c'
+    )
+    for chunk in reader:
+        impressions = pd.to_numeric(chunk['Impressions'], errors='coerce')
+        mask = impressions.to_numpy(dtype='float64', na_value=np.nan) >= 10
+        if brand_set:
+            mask &= ~chunk['Query'].isin(brand_set).to_numpy(dtype='bool')
+        chunk = chunk.loc[mask]
+        sums = impressions.loc[mask].groupby(
+            [chunk['Query'], chunk['Landing Page']], sort=False
+        ).sum()
+        pair_totals = sums if pair_totals is None else pair_totals.add(sums, fill_value=0)
+
+    if pair_totals is None or pair_totals.empty:
+        return pd.DataFrame(columns=FINAL_COLUMNS), pd.DataFrame(columns=TOP_COLUMNS)
+
+    pairs = pair_totals.astype('int64').rename('Impressions').reset_index()
+    return _finalize_pairs(pairs)
+
+@st.cache_data(show_spinner=False)
+def process_data(csv_bytes: bytes, brand_terms: tuple[str, ...]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Run the full clean-and-aggregate pipeline on the raw CSV bytes.
+
+    Streamlit caches the result on the upload's bytes and the normalized
+    brand-term tuple, so reruns with the same inputs skip the parse and
+    every groupby. Raises ValueError when required columns are missing.
+    """
+    # Large uploads take the Polars plan when the dependency is installed,
+    # or the chunked streaming path otherwise
+    if len(csv_bytes) > LARGE_UPLOAD_BYTES:
+        if pl is not None:
+            return _process_data_polars(csv_bytes, brand_terms)
+        return _process_data_chunked(csv_bytes, brand_terms)
+
+    # Read the CSV file, parsing only the columns the pipeline uses.
+    # The pyarrow engine is multithreaded and backs strings with Arrow
+    # arrays, which hash faster in the groupby/dedupe steps below.
+    buffer = BytesIO(csv_bytes)
+    try:
+        df = pd.read_csv(
+            buffer,
+            engine='pyarrow',
+            usecols=REQUIRED_COLUMNS,
+            dtype_backend='pyarrow',
+        )
+    except (ImportError, ValueError, KeyError):
+        # pyarrow unavailable, or the file is missing a required column
+        # (the pyarrow engine raises ArrowKeyError, a KeyError, for
+        # unknown usecols) — fall back to the default parser and report
+        # missing columns through the validation below.
+        buffer.seek(0)
+        df = pd.read_csv(buffer)
+
+    # Validate Required Columns
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+
+    # Data Cleaning
+    # Build one combined row mask — impressions threshold (which also drops
+    # non-numeric rows, since NaN compares False), plus the branded-term
+    # filter — so the frame is gathered once instead of once per filter
+    impressions = pd.to_numeric(df['Impressions'], errors='coerce')
+    mask = impressions.to_numpy(dtype='float64', na_value=np.nan) >= 10
+    if brand_terms:
+        mask &= ~df['Query'].isin(frozenset(brand_terms)).to_numpy(dtype='bool')
+    df = df.loc[mask].copy()
+    if df.empty:
+        # Nothing survived the threshold/brand filters; skip the groupbys
+        return pd.DataFrame(columns=FINAL_COLUMNS), pd.DataFrame(columns=TOP_COLUMNS)
+    # int32 is plenty for search-console impressions and halves the memory
+    # bandwidth of the hottest numeric column in every step below
+    df['Impressions'] = impressions.loc[mask].astype('int32')
+
+    # Cast the key columns to categorical once (on the surviving rows only)
+    # so every later groupby/dedupe hashes integer codes instead of strings
+    df['Query'] = df['Query'].astype('category')
+    df['Landing Page'] = df['Landing Page'].astype('category')
+
+    # Collapse duplicate (Query, Landing Page) rows (e.g. per-device or
+    # per-country exports) by summing their impressions, so the
+    # percentage math below runs once per pair instead of per raw row
+    df = df.groupby(
+        ['Query', 'Landing Page'], as_index=False, observed=True, sort=False
+    )['Impressions'].sum()
+
+    return _finalize_pairs(df)
+
+def _finalize_pairs(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Turn a pair-aggregated frame (one row per Query/Landing Page with
+    summed Impressions) into the display frame and the top-10 view."""
+    # One fused pass over the Query keys: per-query totals for the
+    # percentage math and per-query page counts for cannibalization.
+    # The pair-level aggregation already left one row per
+    # (Query, Landing Page), so a plain row count equals the number of
+    # distinct pages — no per-group hashset as with nunique.
+    query_agg = df.groupby('Query', observed=True, sort=False).agg(
+        total=('Impressions', 'sum'),
+        n_pages=('Landing Page', 'size'),
+    )
+    # reindex + to_numpy materializes the broadcast as plain integers;
+    # Series.map on the categorical Query column would map the categories
+    # and hand back another categorical, breaking the arithmetic below
+    df['Total Keyword Impressions'] = query_agg['total'].reindex(df['Query']).to_numpy(dtype='int64')
 
+    # Keep rows holding 10%-75% of their query's impressions, using
+    # integer ratio compares so no float division runs on the full frame.
+    # The compares run in int64: at int32 the *100 product wraps around
+    # ~21M impressions and silently corrupts the filter.
+    total = df['Total Keyword Impressions']
+    impressions64 = df['Impressions'].astype('int64')
+    df = df[(impressions64 * 10 > total) & (impressions64 * 100 < 75 * total)]
+    if df.empty:
+        # Every query is dominated by a single page; no cannibalization to show
+        return pd.DataFrame(columns=FINAL_COLUMNS), pd.DataFrame(columns=TOP_COLUMNS)
+
+    # Build the final frame in one constructor: fresh contiguous columns in
+    # display order, with the rounded-up percentage computed on the survivors
+    # only. The percent sign is added at display time so this column (and
+    # the CSV download) stays numeric.
+    impressions = df['Impressions'].to_numpy()
+    totals = df['Total Keyword Impressions'].to_numpy()
+    df = pd.DataFrame({
+        'Landing Page': df['Landing Page'].to_numpy(),
+        'Query': df['Query'].to_numpy(),
+        'Impressions': impressions,
+        'Total Keyword Impressions': totals,
+        # Exact ceiling division (all values positive) — float rounding
+        # could otherwise nudge e.g. an exact 60% up to 61%
+        'Percentage of Impressions': (
+            (impressions.astype(np.int64) * 100 + totals - 1) // totals
+        ).astype(np.int32),
+    })
+
+    # Single final sort: 'Total Keyword Impressions' descending, ties
+    # broken alphabetically by 'Query' in the same stable pass
+    df = df.sort_values(
+        by=['Total Keyword Impressions', 'Query'],
+        ascending=[False, True],
+        kind='stable',
+    )
+
+    # Identify Top 10 Cannibalized Keywords
+    # Define cannibalization as Queries with multiple Landing Pages,
+    # reusing the fused per-query aggregation from above
+    cannibalization = query_agg[query_agg['n_pages'] > 1].reset_index()
+    cannibalization.columns = TOP_COLUMNS
+    top_cannibalized = cannibalization.nlargest(10, 'Total Keyword Impressions')
+
+    return df, top_cannibalized
+
+@st.cache_data(show_spinner=False)
+def convert_df_to_csv(df: pd.DataFrame) -> bytes:
+    """Serialize the cleaned frame straight to UTF-8 bytes in one pass.
+
+    Writing into a BytesIO avoids materializing the whole CSV as a
+    Python str first, and the cache means re-clicking the download
+    button does not re-serialize the same frame.
+    """
+    buffer = BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8', lineterminator='\n')
+    return buffer.getvalue()
+
+# Page configuration runs once at module scope, before any other
+# Streamlit command, keeping main() free of static scaffolding
+st.set_page_config(page_title="📊 Keyword Cannibalisation", layout="wide")
+
+def render_intro():
+    """Render the static header: title, video instructions and blurb."""
     # App Title
     st.title("📊 Keyword Cannibalisation")
 
@@ -23,14 +270,14 @@ def main():
         st.markdown("""
         ## 📥 How to Export CSV from Looker Studio
         To export your CSV file from the Looker Studio report, follow these steps:
-        
+
         1. **Open the Report**: [Click here to access the Looker Studio report](https://lookerstudio.google.com/u/0/reporting/f3b15314-d09d-4f40-bf3e-4bf37813dfd1/page/6zXD).
         2. **Navigate to the Desired Page**: Go to the specific page where your data is displayed.
         3. **Export the Data**:
            - Click on the **Export** button (usually represented by a download icon).
            - Choose **CSV** as the export format.
            - Follow the on-screen prompts to save the file to your desired location.
-        
+
         **Note:** Ensure you have the necessary permissions to export data from the report.
         """, unsafe_allow_html=True)
 
@@ -44,142 +291,102 @@ def main():
     - Providing a cleaned CSV for download
     """)
 
-    # Create a form for user inputs
+def render_form():
+    """Render the input form; returns (brand terms text, upload, submitted)."""
     with st.form(key='filter_form'):
         st.header("🔧 Configuration")
-        
+
         # 1. Input for Branded Search Terms
         query_to_remove = st.text_input(
             "📝 Enter the branded search terms to remove (separated by commas):",
             placeholder="e.g., BrandA, BrandB, BrandC"
         )
-        
+
         # 2. File Upload
         uploaded_file = st.file_uploader("📂 Upload Your CSV File", type=["csv"])
-        
+
         # 3. Submit Button
         submit_button = st.form_submit_button(label='✅ Submit and Clean Data')
 
+    return query_to_remove, uploaded_file, submit_button
+
+def render_results(df: pd.DataFrame, top_cannibalized: pd.DataFrame):
+    """Render the cleaned table, download button and top-10 chart."""
+    # Success message
+    st.success("✅ Data processing complete!")
+
+    # Display Final Cleaned Data
+    st.subheader("📈 Final Cleaned Data")
+    st.dataframe(
+        df,
+        column_config={
+            'Percentage of Impressions': st.column_config.NumberColumn(format='%d%%'),
+        },
+    )
+
+    # Provide Download Option
+    csv = convert_df_to_csv(df)
+
+    st.download_button(
+        label="📥 Download Cleaned CSV",
+        data=csv,
+        file_name='cleaned_data.csv',
+        mime='text/csv',
+    )
+
+    # Visualization: Top 10 Cannibalized Keywords
+    if not top_cannibalized.empty:
+        st.subheader("📊 Top 10 Cannibalized Keywords")
+        # A continuous scale over the numeric page count keeps this a
+        # single trace, instead of one trace (and legend entry) per count
+        fig = px.bar(
+            top_cannibalized,
+            x='Query',
+            y='Total Keyword Impressions',
+            color='Landing Page',
+            color_continuous_scale='Blues',
+            labels={
+                'Query': 'Keyword',
+                'Total Keyword Impressions': 'Total Impressions',
+                'Landing Page': 'Number of Landing Pages'
+            },
+            title='Top 10 Keywords Being Cannibalized'
+        )
+        fig.update_layout(xaxis_title='Keyword', yaxis_title='Total Impressions')
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("ℹ️ No cannibalized keywords found in the data.")
+
+def main():
+    render_intro()
+    query_to_remove, uploaded_file, submit_button = render_form()
+
     # Process the data after form submission
     if submit_button:
         if uploaded_file is not None:
             try:
+                # Normalize the branded terms into a sorted tuple so the
+                # cache key is stable regardless of comma ordering
+                brand_terms = tuple(sorted(
+                    frozenset(filter(None, (query.strip() for query in query_to_remove.split(','))))
+                )) if query_to_remove else ()
+
                 # Start spinner
                 with st.spinner("⏳ Processing your data..."):
-                    # Read the CSV file
-                    df = pd.read_csv(uploaded_file)
-                    
-                    # Validate Required Columns
-                    required_columns = ['Impressions', 'Query', 'Landing Page']
-                    missing_columns = [col for col in required_columns if col not in df.columns]
-                    if missing_columns:
-                        st.error(f"❌ Missing required columns: {', '.join(missing_columns)}")
-                        st.stop()
-                    
-                    # Data Cleaning
-                    # Convert 'Impressions' to numeric, coerce errors, and drop rows with non-numeric 'Impressions'
-                    df['Impressions'] = pd.to_numeric(df['Impressions'], errors='coerce')
-                    initial_row_count = df.shape[0]
-                    df = df.dropna(subset=['Impressions'])
-                    df['Impressions'] = df['Impressions'].astype(int)
-                    dropped_non_numeric = initial_row_count - df.shape[0]
-                    
-                    # Sort the DataFrame by 'Impressions' in descending order
-                    df = df.sort_values(by='Impressions', ascending=False)
-                    
-                    # Process Branded Search Terms
-                    if query_to_remove:
-                        queries_to_remove = [query.strip() for query in query_to_remove.split(',') if query.strip()]
-                        if queries_to_remove:
-                            df = df[~df['Query'].isin(queries_to_remove)]
-                    else:
-                        queries_to_remove = []
-                    
-                    # Drop rows with 'Impressions' less than 10
-                    before_filter = df.shape[0]
-                    df = df[df['Impressions'] >= 10]
-                    dropped_low_impressions = before_filter - df.shape[0]
-                    
-                    # Calculate total impressions for each query
-                    total_impressions = df.groupby('Query')['Impressions'].sum().reset_index()
-                    total_impressions.columns = ['Query', 'Total Keyword Impressions']
-                    df = pd.merge(df, total_impressions, on='Query', how='left')
-                    
-                    # Calculate the percentage of impressions for each URL
-                    df['Percentage of Impressions'] = (df['Impressions'] / df['Total Keyword Impressions']) * 100
-                    
-                    # Drop duplicates based on 'Query' and 'Landing Page'
-                    df = df.drop_duplicates(subset=['Query', 'Landing Page'])
-                    
-                    # Filter based on 'Percentage of Impressions'
-                    df = df[(df['Percentage of Impressions'] > 10) & (df['Percentage of Impressions'] < 75)]
-                    
-                    # Reorder columns
-                    df = df[['Landing Page', 'Query', 'Impressions', 'Total Keyword Impressions', 'Percentage of Impressions']]
-                    
-                    # Sort alphabetically by 'Query'
-                    df = df.sort_values(by='Query')
-                    
-                    # Round up 'Percentage of Impressions' and add a percent sign
-                    df['Percentage of Impressions'] = np.ceil(df['Percentage of Impressions']).astype(int).astype(str) + '%'
-                    
-                    # Final Sorting by 'Total Keyword Impressions' Descending
-                    df = df.sort_values(by='Total Keyword Impressions', ascending=False)
-                    
-                    # Identify Top 10 Cannibalized Keywords
-                    # Define cannibalization as Queries with multiple Landing Pages
-                    cannibalization = df.groupby('Query').agg({
-                        'Landing Page': 'nunique',
-                        'Total Keyword Impressions': 'first'  # Since it's sorted, first will have the total
-                    }).reset_index()
-                    cannibalization = cannibalization[cannibalization['Landing Page'] > 1]
-                    top_cannibalized = cannibalization.sort_values(by='Total Keyword Impressions', ascending=False).head(10)
-                
-                # Success message
-                st.success("✅ Data processing complete!")
-
-                # Display Final Cleaned Data
-                st.subheader("📈 Final Cleaned Data")
-                st.dataframe(df)
-
-                # Provide Download Option
-                def convert_df_to_csv(df):
-                    return df.to_csv(index=False).encode('utf-8')
-
-                csv = convert_df_to_csv(df)
-
-                st.download_button(
-                    label="📥 Download Cleaned CSV",
-                    data=csv,
-                    file_name='cleaned_data.csv',
-                    mime='text/csv',
-                )
-
-                # Visualization: Top 10 Cannibalized Keywords
-                if not top_cannibalized.empty:
-                    st.subheader("📊 Top 10 Cannibalized Keywords")
-                    fig = px.bar(
-                        top_cannibalized,
-                        x='Query',
-                        y='Total Keyword Impressions',
-                        color='Landing Page',
-                        labels={
-                            'Query': 'Keyword',
-                            'Total Keyword Impressions': 'Total Impressions',
-                            'Landing Page': 'Number of Landing Pages'
-                        },
-                        title='Top 10 Keywords Being Cannibalized',
-                        hover_data=['Landing Page']
-                    )
-                    fig.update_layout(xaxis_title='Keyword', yaxis_title='Total Impressions')
-                    st.plotly_chart(fig, use_container_width=True)
-                else:
-                    st.info("ℹ️ No cannibalized keywords found in the data.")
+                    df, top_cannibalized = process_data(uploaded_file.getvalue(), brand_terms)
+
+                if df.empty:
+                    st.warning("⚠️ No rows remain after filtering. Try removing fewer branded terms or uploading a larger export.")
+                    st.stop()
+
+                render_results(df, top_cannibalized)
 
             except pd.errors.EmptyDataError:
                 st.error("❌ Error: The uploaded file is empty.")
             except pd.errors.ParserError:
                 st.error("❌ Error: The uploaded file could not be parsed.")
+            except ValueError as e:
+                st.error(f"❌ {e}")
             except Exception as e:
                 st.error(f"❌ An unexpected error occurred: {e}")
         else:
@@ -189,4 +396,4 @@ if __name__ == "__main__":
     main()
 
 st.markdown("---")
-st.markdown("© 2025 Calibre Nine | [GitHub Repository](https://github.com/chrisprideC9)")
\ No newline at end of file
+st.markdown("© 2025 Calibre Nine | [GitHub Repository](https://github.com/chrisprideC9)")
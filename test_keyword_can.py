@@ -0,0 +1,110 @@
+"""End-to-end smoke tests for the data pipeline in keyword_can."""
+
+import pandas as pd
+import pytest
+
+import keyword_can
+from keyword_can import FINAL_COLUMNS, TOP_COLUMNS, process_data
+
+SMALL_CSV = b"""Query,Landing Page,Impressions
+widgets,/a,15
+widgets,/a,10
+widgets,/b,35
+gadgets,/g,50
+tiny,/t,5
+widgets,/c,not-a-number
+"""
+
+def test_process_data_smoke():
+    df, top_cannibalized = process_data(SMALL_CSV, ())
+
+    assert list(df.columns) == FINAL_COLUMNS
+    assert list(top_cannibalized.columns) == TOP_COLUMNS
+
+    # gadgets (100% of its query), tiny (<10 impressions) and the
+    # non-numeric row are all dropped; the duplicate widgets,/a pair is
+    # summed to 25, leaving the two widgets pages at ~42% and ~58%
+    assert len(df) == 2
+    assert set(df['Query']) == {'widgets'}
+    assert sorted(df['Impressions']) == [25, 35]
+    assert list(df['Total Keyword Impressions']) == [60, 60]
+    assert sorted(df['Percentage of Impressions']) == [42, 59]
+
+    # widgets is the only query split across multiple landing pages
+    assert list(top_cannibalized['Query']) == ['widgets']
+    assert list(top_cannibalized['Landing Page']) == [2]
+    assert list(top_cannibalized['Total Keyword Impressions']) == [60]
+
+def test_process_data_missing_column_raises_clean_error():
+    # Regardless of which CSV engine handled the read, a missing column
+    # must surface as the ValueError main() turns into its error message
+    with pytest.raises(ValueError, match="Missing required columns: Landing Page"):
+        process_data(b"Query,Impressions\nq,50\n", ())
+
+def test_process_data_exact_percentages():
+    csv = b"Query,Landing Page,Impressions\nq,/a,60\nq,/b,40\n"
+    df, _ = process_data(csv, ())
+
+    # Exact shares must not pick up float rounding (60% rendering as 61%)
+    assert sorted(df['Percentage of Impressions']) == [40, 60]
+
+def test_process_data_large_counts_do_not_overflow():
+    csv = b"Query,Landing Page,Impressions\nbig,/a,30000000\nbig,/b,70000000\n"
+    df, _ = process_data(csv, ())
+
+    # At int32 the *100 ratio compares would wrap and drop both rows
+    assert len(df) == 2
+    assert list(df['Total Keyword Impressions']) == [100_000_000, 100_000_000]
+    assert sorted(df['Percentage of Impressions']) == [30, 70]
+
+def _assert_same_results(results, expected):
+    # Row order within total/query ties is unspecified, and the paths
+    # differ in integer widths, so compare on sorted rows and values only
+    df, top_cannibalized = results
+    expected_df, expected_top = expected
+    pd.testing.assert_frame_equal(
+        df.sort_values(['Query', 'Landing Page']).reset_index(drop=True),
+        expected_df.sort_values(['Query', 'Landing Page']).reset_index(drop=True),
+        check_dtype=False,
+    )
+    pd.testing.assert_frame_equal(
+        top_cannibalized.reset_index(drop=True),
+        expected_top.reset_index(drop=True),
+        check_dtype=False,
+        check_categorical=False,
+    )
+
+@pytest.mark.skipif(keyword_can.pl is None, reason="polars not installed")
+def test_polars_path_matches_pandas():
+    # The >50 MB threshold means uploads never reach this path in tests,
+    # so pin its behaviour to the pandas pipeline explicitly
+    _assert_same_results(
+        keyword_can._process_data_polars(SMALL_CSV, ()),
+        process_data(SMALL_CSV, ()),
+    )
+    _assert_same_results(
+        keyword_can._process_data_polars(SMALL_CSV, ('widgets',)),
+        process_data(SMALL_CSV, ('widgets',)),
+    )
+
+def test_chunked_path_matches_pandas():
+    # chunksize=2 splits the fixture across several chunks, so the
+    # running cross-chunk Series.add accumulation is exercised too
+    _assert_same_results(
+        keyword_can._process_data_chunked(SMALL_CSV, (), chunksize=2),
+        process_data(SMALL_CSV, ()),
+    )
+    _assert_same_results(
+        keyword_can._process_data_chunked(SMALL_CSV, ('widgets',), chunksize=2),
+        process_data(SMALL_CSV, ('widgets',)),
+    )
+
+def test_process_data_brand_filter():
+    df, top_cannibalized = process_data(SMALL_CSV, ('widgets',))
+
+    # With widgets removed nothing survives the percentage band, and the
+    # empty frames keep their column layouts
+    assert df.empty
+    assert top_cannibalized.empty
+    assert list(df.columns) == FINAL_COLUMNS
+    assert list(top_cannibalized.columns) == TOP_COLUMNS